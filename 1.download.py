@@ -2,32 +2,39 @@ import os
 import collections
 import json
 import ftplib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from urllib.request import urlretrieve
 
 host = 'ftp.ncbi.nih.gov'
-ftp_root = 'ftp://{}/'.format(host)
+
+def ftp_retrieve(ftp_path, directory):
+    """
+    Download a single file from the NCBI FTP server and return its
+    modification time. ftplib connections are not thread-safe, so each call
+    uses its own session for both the RETR and the MDTM.
+    """
+    path = os.path.join(directory, ftp_path.split('/')[-1])
+    with ftplib.FTP(host) as ftp:
+        ftp.login()
+        with open(path, 'wb') as write_file:
+            ftp.retrbinary('RETR ' + ftp_path, write_file.write)
+        modified = ftp.sendcmd('MDTM ' + ftp_path)
+    _, modified = modified.split(' ')
+    return datetime.strptime(modified, '%Y%m%d%H%M%S')
 
 def ncbi_ftp_download(ftp_paths, directory):
     """
-    Download files from the NCBI FTP server. Returns a dictionary with datetime
-    information.
+    Download files from the NCBI FTP server in parallel. Returns a dictionary
+    with datetime information.
     """
-    for ftp_path in ftp_paths:
-        url = ftp_root + ftp_path
-        path = os.path.join(directory, ftp_path.split('/')[-1])
-        urlretrieve(url, path)
+    with ThreadPoolExecutor(max_workers=max(1, len(ftp_paths))) as executor:
+        modified_times = list(executor.map(
+            lambda ftp_path: ftp_retrieve(ftp_path, directory), ftp_paths))
 
     versions = collections.OrderedDict()
     versions['retrieved'] = datetime.utcnow().isoformat()
-
-    with ftplib.FTP(host) as ftp:
-        ftp.login()
-        for ftp_path in ftp_paths:
-            modified = ftp.sendcmd('MDTM ' + ftp_path)
-            _, modified = modified.split(' ')
-            modified = datetime.strptime(modified, '%Y%m%d%H%M%S')
-            versions[ftp_path] = modified.isoformat()
+    for ftp_path, modified in zip(ftp_paths, modified_times):
+        versions[ftp_path] = modified.isoformat()
     
     return versions
 
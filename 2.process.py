@@ -1,7 +1,43 @@
 import os
-import collections
-
+import io
+import csv
+import gzip
+import hashlib
+import itertools
+import tempfile
+
+import numpy
 import pandas
+import pyarrow
+
+try:
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
+
+
+def open_gzip(path, buffer_size=128 * 1024):
+    """
+    Open a gzipped file for binary reading. Decompresses in parallel across
+    all cores when rapidgzip is installed. Otherwise, falls back to gzip with a
+    read buffer larger than the 8 KB default, so fewer (and larger) chunks are
+    inflated per read.
+    """
+    if rapidgzip is not None:
+        return rapidgzip.open(path, parallelization=os.cpu_count())
+    return io.BufferedReader(gzip.open(path, 'rb'), buffer_size=buffer_size)
+
+
+def filter_human(df):
+    """
+    Keep Homo sapiens rows (`tax_id == 9606`) and drop the `tax_id` column.
+    Skips the row gather when every row is already human, as is the case for
+    `Homo_sapiens.gene_info.gz`.
+    """
+    is_human = df['tax_id'].values == 9606
+    if not is_human.all():
+        df = df.loc[is_human]
+    return df.drop(['tax_id'], axis='columns')
 
 
 def create_history_df(path):
@@ -12,97 +48,112 @@ def create_history_df(path):
     dataset.
     """
 
-    renamer = collections.OrderedDict([
-        ('Discontinued_GeneID', 'old_entrez_gene_id'),
-        ('GeneID', 'new_entrez_gene_id'),
-        ('Discontinue_Date', 'date'),
-        ('#tax_id', 'tax_id'),
-    ])
-
-    history_df = (
-        pandas.read_table(path, compression='gzip', na_values='-')
-        [list(renamer)]
-        .rename(columns=renamer)
-        .query("tax_id == 9606")
-        .drop(['tax_id'], axis='columns')
-        .dropna(subset=['new_entrez_gene_id'])
-        .sort_values('old_entrez_gene_id')
-    )
+    renamer = {
+        'Discontinued_GeneID': 'old_entrez_gene_id',
+        'GeneID': 'new_entrez_gene_id',
+        'Discontinue_Date': 'date',
+        '#tax_id': 'tax_id',
+    }
+
+    with open_gzip(path) as read_file:
+        history_df = (
+            pandas.read_csv(read_file, sep='\t', na_values='-',
+                            engine='pyarrow', usecols=list(renamer),
+                            dtype={'#tax_id': 'int32', 'GeneID': 'Int64'})
+            [list(renamer)]
+            .rename(columns=renamer)
+            .pipe(filter_human)
+            .dropna(subset=['new_entrez_gene_id'])
+            .sort_values('old_entrez_gene_id')
+        )
     history_df.new_entrez_gene_id = history_df.new_entrez_gene_id.astype(int)
 
     return history_df
 
 
-def get_gene_info(path, renamer):
+def get_gene_info(path):
     """
     Read in and process gene information file. Filters genes to Homo sapiens
-    with `tax_id == 9606` to remove Neanderthals et al.
+    with `tax_id == 9606` to remove Neanderthals et al. Reads the union of
+    columns needed by `create_gene_df` and `create_gene_xref_df`, so the file
+    only needs to be parsed once.
     """
-    gene_df = (
-        pandas.read_table(path,
-                          compression='gzip',
-                          na_values='-',
-                          low_memory=False)
-        [list(renamer)]
-        .rename(columns=renamer)
-        .query("tax_id == 9606")
-        .drop(['tax_id'], axis='columns')
-        .sort_values('entrez_gene_id')
-    )
+
+    renamer = {
+        'GeneID': 'entrez_gene_id',
+        'Symbol': 'symbol',
+        'description': 'description',
+        'chromosome': 'chromosome',
+        'type_of_gene': 'gene_type',
+        'Synonyms': 'synonyms',
+        'Other_designations': 'aliases',
+        'dbXrefs': 'other_ids',
+        '#tax_id': 'tax_id',
+    }
+
+    with open_gzip(path) as read_file:
+        gene_df = (
+            pandas.read_csv(read_file, sep='\t', na_values='-',
+                            engine='pyarrow', usecols=list(renamer),
+                            dtype={'#tax_id': 'int32', 'GeneID': 'int64'})
+            [list(renamer)]
+            .rename(columns=renamer)
+            .pipe(filter_human)
+        )
+
+    # Sort by argsorting the integer ids, then gathering all rows at once
+    order = numpy.argsort(gene_df['entrez_gene_id'].values, kind='stable')
+    gene_df = gene_df.take(order)
 
     return gene_df
 
 
-def create_gene_df(path):
+def create_gene_df(gene_info_df):
     """
-    Process `Homo_sapiens.gene_info.gz` for Project Cognoma.
+    Process `Homo_sapiens.gene_info.gz`, as read by `get_gene_info`, for
+    Project Cognoma.
     """
 
-    renamer = collections.OrderedDict([
-        ('GeneID', 'entrez_gene_id'),
-        ('Symbol', 'symbol'),
-        ('description', 'description'),
-        ('chromosome', 'chromosome'),
-        ('type_of_gene', 'gene_type'),
-        ('Synonyms', 'synonyms'),
-        ('Other_designations', 'aliases'),
-        ('#tax_id', 'tax_id'),
-    ])
-
-    gene_df = get_gene_info(path=path, renamer=renamer)
+    cols = [
+        'entrez_gene_id',
+        'symbol',
+        'description',
+        'chromosome',
+        'gene_type',
+        'synonyms',
+        'aliases',
+    ]
+
+    # Low cardinality columns are cheaper to copy, dedup, and sort as categories
+    gene_df = (
+        gene_info_df
+        .loc[:, cols]
+        .astype({'chromosome': 'category', 'gene_type': 'category'})
+    )
 
     return gene_df
 
 
-def create_gene_xref_df(path):
+def create_gene_xref_df(gene_info_df):
     """
-    Extract xrefs from `Homo_sapiens.gene_info.gz` for Project Cognoma. Will
-    output long data frame of entrez_gene_id by xref identifier.
+    Extract xrefs from `Homo_sapiens.gene_info.gz`, as read by
+    `get_gene_info`, for Project Cognoma. Will output long data frame of
+    entrez_gene_id by xref identifier.
     """
 
-    renamer = collections.OrderedDict([
-        ('GeneID', 'entrez_gene_id'),
-        ('dbXrefs', 'other_ids'),
-        ('#tax_id', 'tax_id')
-    ])
-
-    gene_df = get_gene_info(path=path, renamer=renamer)
+    gene_df = gene_info_df.loc[:, ['entrez_gene_id', 'other_ids']]
 
     # Isolate each dbXref independently and match to entrez_gene_id
     gene_df = gene_df.pipe(tidy_split, column='other_ids', keep=False)
 
-    # Expand the other ids by first colon delimiter
-    other_ids = gene_df['other_ids'].str.split(pat=':', n=1, expand=True)
+    # Partition the other ids by first colon delimiter
+    parts = [other_id.partition(':') for other_id in gene_df['other_ids'].values]
+    gene_df['resource'] = pandas.Categorical([part[0] for part in parts])
+    # Xrefs without a colon have no identifier, as with str.split
+    gene_df['identifier'] = [part[2] if part[1] else None for part in parts]
+    gene_df = gene_df.drop(['other_ids'], axis='columns')
 
-    # Merge entrez genes to other identifiers
-    gene_df = (
-        pandas.concat([gene_df, other_ids], axis='columns')
-        .drop(['other_ids'], axis='columns')
-    )
-
-    # Rename columns before outputing
     cols = ['entrez_gene_id', 'resource', 'identifier']
-    gene_df.columns = cols
     gene_df = (
         gene_df
         .sort_values(by=cols)
@@ -133,19 +184,23 @@ def tidy_split(df, column, sep='|', keep=False):
     pandas.DataFrame
         Returns a dataframe with the same columns as `df`.
     """
-    indexes = list()
-    new_values = list()
     df = df.dropna(subset=[column])
-    for i, presplit in enumerate(df[column].astype(str)):
-        values = presplit.split(sep)
-        if keep and len(values) > 1:
-            indexes.append(i)
-            new_values.append(presplit)
-        for value in values:
-            indexes.append(i)
-            new_values.append(value)
-    new_df = df.iloc[indexes, :].copy()
-    new_df[column] = new_values
+    presplits = [str(presplit) for presplit in df[column].values]
+    splits = [presplit.split(sep) for presplit in presplits]
+    if keep:
+        splits = [
+            [presplit] + values if len(values) > 1 else values
+            for presplit, values in zip(presplits, splits)
+        ]
+    counts = numpy.fromiter(map(len, splits), dtype=numpy.int64,
+                            count=len(splits))
+    indexes = numpy.repeat(numpy.arange(len(df), dtype=numpy.int64), counts)
+    new_values = numpy.fromiter(itertools.chain.from_iterable(splits),
+                                dtype=object, count=counts.sum())
+    new_df = pandas.DataFrame({
+        col: new_values if col == column else df[col].values[indexes]
+        for col in df.columns
+    }, columns=df.columns)
     return new_df
 
 
@@ -156,55 +211,152 @@ def get_chr_symbol_map(gene_df):
     symbols should map and the majority of synonyms should also map. Only
     synonyms that are ambigious within a chromosome are removed.
     """
-    primary_df = (
+    # Expand chromosomes once and reuse for both symbols and synonyms
+    chromosome_df = (
         gene_df
-        .loc[:, ['entrez_gene_id', 'chromosome', 'symbol']]
+        .loc[:, ['entrez_gene_id', 'chromosome']]
         .pipe(tidy_split, column='chromosome', keep=True)
+        .astype({'chromosome': 'category'})
+    )
+
+    primary_df = (
+        gene_df
+        .loc[:, ['entrez_gene_id', 'symbol']]
+        .merge(chromosome_df, on='entrez_gene_id')
+        .assign(source=0)
     )
 
     synonym_df = (
         gene_df
-        .loc[:, ['entrez_gene_id', 'chromosome', 'synonyms']]
+        .loc[:, ['entrez_gene_id', 'synonyms']]
         .rename(columns={'synonyms': 'symbol'})
         .pipe(tidy_split, column='symbol', keep=False)
-        .pipe(tidy_split, column='chromosome', keep=True)
-        .drop_duplicates(['chromosome', 'symbol'], keep=False)
+        .merge(chromosome_df, on='entrez_gene_id')
+        .assign(source=1)
     )
 
-    map_df = (
-        primary_df
-        .append(synonym_df)
-        .drop_duplicates(subset=['chromosome', 'symbol'], keep='first')
-        .loc[:, ['symbol', 'chromosome', 'entrez_gene_id']]
-        .sort_values(['symbol', 'chromosome'])
+    combined_df = pandas.concat([primary_df, synonym_df], ignore_index=True)
+
+    # Group chromosome-symbol pairs in a single hash pass. Keep the first row
+    # of each pair if it is an approved symbol, or if it is a synonym that is
+    # unambiguous within its chromosome. Like drop_duplicates, missing
+    # symbols form a pair of their own.
+    groups = combined_df.groupby(['chromosome', 'symbol'], sort=False,
+                                 observed=True, dropna=False)
+    keep = (groups.cumcount() == 0) & (
+        (combined_df['source'] == 0) |
+        (groups['source'].transform('size') == 1)
     )
+    map_df = combined_df.loc[keep, ['symbol', 'chromosome', 'entrez_gene_id']]
+
+    # Sort by symbol then chromosome (categories are in lexical order). Missing
+    # symbols are blanked, since lexsort cannot compare NaN with str, and sort
+    # last, as with sort_values.
+    symbols = map_df['symbol']
+    order = numpy.lexsort((
+        map_df['chromosome'].cat.codes.values,
+        symbols.fillna('').values,
+        symbols.isna().values,
+    ))
+    map_df = map_df.take(order)
 
     return map_df
 
 
+def write_tsv(df, path):
+    """
+    Write a dataframe to a TSV without its index, leaving missing values
+    empty. Rows are formatted by the csv module's C writer. For the string and
+    integer columns written here, output matches `DataFrame.to_csv`.
+    """
+    columns = [
+        df[column].astype(object).where(df[column].notna(), '').tolist()
+        for column in df.columns
+    ]
+    with open(path, 'w', newline='') as write_file:
+        writer = csv.writer(write_file, delimiter='\t', lineterminator='\n')
+        writer.writerow(df.columns)
+        writer.writerows(zip(*columns))
+
+
+def get_cache_key():
+    """
+    Return a hash of this script's source, so editing it invalidates the
+    Parquet caches. Returns None when the source file is unavailable (for
+    example, when the script is run through `exec`).
+    """
+    try:
+        with open(__file__, 'rb') as read_file:
+            return hashlib.sha256(read_file.read()).hexdigest()
+    except (NameError, OSError):
+        return None
+
+
+def read_cached(path, reader):
+    """
+    Return `reader(path)`, caching the result as Parquet alongside `path`. The
+    cache is reused while it is newer than `path` and was written by the same
+    version of this script (see `get_cache_key`). A missing, stale, or
+    unreadable cache is treated as a miss, and caching is skipped when no key
+    is available.
+    """
+    cache_key = get_cache_key()
+    if cache_key is None:
+        return reader(path)
+
+    cache_path = os.path.splitext(path)[0] + '.parquet'
+    try:
+        if os.path.getmtime(cache_path) > os.path.getmtime(path):
+            df = pandas.read_parquet(cache_path)
+            if df.attrs.get('cache_key') == cache_key:
+                return df
+    except (OSError, pyarrow.ArrowException):
+        pass
+
+    df = reader(path)
+    df.attrs['cache_key'] = cache_key
+
+    # Write to a temporary file and then rename it into place, so an
+    # interrupted write never leaves a truncated cache behind
+    directory = os.path.dirname(cache_path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.parquet')
+    os.close(fd)
+    try:
+        df.to_parquet(temp_path)
+        os.replace(temp_path, cache_path)
+    except (OSError, pyarrow.ArrowException):
+        os.remove(temp_path)
+    return df
+    df = reader(path)
+    df.attrs['cache_key'] = cache_key
+    df.to_parquet(cache_path)
+    return df
+
+
 if __name__ == '__main__':
 
     # History mapper
     path = os.path.join('download', 'gene_history.gz')
-    history_df = create_history_df(path)
+    history_df = read_cached(path, create_history_df)
 
     path = os.path.join('data', 'updater.tsv')
-    history_df.to_csv(path, index=False, sep='\t')
+    write_tsv(history_df, path)
 
     # Genes data
-    info_path = os.path.join('download', 'Homo_sapiens.gene_info.gz')
-    gene_df = create_gene_df(info_path)
+    path = os.path.join('download', 'Homo_sapiens.gene_info.gz')
+    gene_info_df = read_cached(path, get_gene_info)
+    gene_df = create_gene_df(gene_info_df)
 
     path = os.path.join('data', 'genes.tsv')
-    gene_df.to_csv(path, index=False, sep='\t')
+    write_tsv(gene_df, path)
 
     # Genes xref data
-    gene_xref_df = create_gene_xref_df(info_path)
+    gene_xref_df = create_gene_xref_df(gene_info_df)
 
     path = os.path.join('data', 'genes-xrefs.tsv')
-    gene_xref_df.to_csv(path, index=False, sep='\t')
+    write_tsv(gene_xref_df, path)
 
     # Chromosome-Symbol Map
     map_df = get_chr_symbol_map(gene_df)
     path = os.path.join('data', 'chromosome-symbol-mapper.tsv')
-    map_df.to_csv(path, index=False, sep='\t')
+    write_tsv(map_df, path)